@@ -1,7 +1,7 @@
 """
 Pydantic schemas for API requests/responses
 """
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional
 from datetime import datetime
 
@@ -16,6 +16,28 @@ class MistakeAnalysis(BaseModel):
     correct_answer: Optional[str] = None
 
 
+class AnalyzedMistake(BaseModel):
+    """One mistake entry as returned by the AI analysis response"""
+    question_number: int = Field(ge=0)
+    mistake_description: str = ""
+    why_wrong: str = ""
+    how_to_fix: str = ""
+    weak_area: str = "Unknown"
+
+    @field_validator("question_number", mode="before")
+    @classmethod
+    def reject_bool_question_number(cls, value):
+        # bool is an int subclass, but true/false is never a question number
+        if isinstance(value, bool):
+            raise ValueError("question_number must be a number")
+        return value
+
+    @field_validator("mistake_description", "why_wrong", "how_to_fix", "weak_area", mode="before")
+    @classmethod
+    def coerce_text(cls, value):
+        return str(value)
+
+
 class PracticeQuestion(BaseModel):
     id: Optional[str] = None
     question_text: str
@@ -1,13 +1,17 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from PIL import Image
+import asyncio
 import io
 import os
-from typing import List, Optional
-from pydantic import BaseModel
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field, field_validator
 import base64
-import json
+import hashlib
+from collections import OrderedDict
+import re
+import orjson
 
 # Load environment variables first
 from dotenv import load_dotenv
@@ -25,8 +29,8 @@ logger = logging.getLogger(__name__)
 
 # Optional imports - only needed for non-hardcoded functionality
 try:
-    from services.latex_ocr import LatexOCRService
-    from services.ai_analyzer import AIAnalyzer
+    from services.latex_ocr import LatexOCRService, run_ocr
+    from services.ai_analyzer import AIAnalyzer, completion_text
     from services.question_generator import QuestionGenerator
     from services.answer_matcher import AnswerMatcher
     from services.timeout_utils import run_with_timeout, retry_with_timeout
@@ -37,7 +41,9 @@ except ImportError as e:
     logger.warning(f"Optional dependencies not available: {e}")
     HAS_DEPENDENCIES = False
     LatexOCRService = None
+    run_ocr = None
     AIAnalyzer = None
+    completion_text = None
     QuestionGenerator = None
     AnswerMatcher = None
     run_with_timeout = None
@@ -53,8 +59,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 =======
-from services.latex_ocr import LatexOCRService
-from services.ai_analyzer import AIAnalyzer
+from services.latex_ocr import LatexOCRService, run_ocr
+from services.ai_analyzer import AIAnalyzer, completion_text
 from services.question_generator import QuestionGenerator
 from database.models import init_db, get_db
 from database.schemas import TestSubmission, MistakeAnalysis, PracticeQuestion
@@ -109,6 +115,9 @@ class AnalysisResponse(BaseModel):
     test_id: str
     mistakes: List[MistakeAnalysis]
     summary: str
+    extraction_succeeded: bool = True  # False when no answers could be read from the input
+    # The LLM call failed and summary holds the error; internal only, never serialized
+    analysis_failed: bool = Field(default=False, exclude=True)
 
 
 class PracticeResponse(BaseModel):
@@ -116,6 +125,207 @@ class PracticeResponse(BaseModel):
     test_id: str
 
 
+class ExtractionResult(BaseModel):
+    """Questions and final answers as returned by an LLM extraction pass"""
+    questions: Dict[str, str] = {}
+    user_answers: Dict[str, str] = {}
+
+    @field_validator("questions", "user_answers", mode="before")
+    @classmethod
+    def coerce_text_values(cls, value):
+        # The model sometimes returns numeric answers or nulls; keep answers as text
+        if not isinstance(value, dict):
+            return {}
+        return {str(key): str(text) for key, text in value.items() if text is not None}
+
+
+# Extraction is a lookup, not a creative task: sample greedily with a fixed
+# seed so the same content always yields the same answers
+EXTRACTION_TEMPERATURE = 0.0
+EXTRACTION_SEED = 1
+
+# Answer extraction is simpler than mistake analysis; GROQ_EXTRACTION_MODEL can
+# point it at a smaller, faster model such as llama-3.1-8b-instant
+EXTRACTION_MODEL = os.getenv("GROQ_EXTRACTION_MODEL", "llama-3.3-70b-versatile")
+
+# Static instructions for the LLM extraction passes; the student's content is
+# appended last so every request shares an identical prompt prefix
+UPLOAD_PARSE_PROMPT = """Analyze this test image content and extract all questions and their corresponding answers.
+
+IMPORTANT: The student's work may show steps, calculations, or work. The FINAL ANSWER is usually:
+- The last thing written after all the work
+- The value after an equals sign (=) at the end
+- The final result of calculations shown
+- The conclusion or solution at the end of their work
+
+For each question, extract:
+1. Question number and question text
+2. The student's FINAL ANSWER (extract from their work/steps - look for the final result, not intermediate steps)
+
+Look for patterns like:
+- Question 1: [question text]
+  [student's work/steps]
+  = [final answer]  <- This is what we want
+  
+- Or just the final value/expression at the end of their work
+
+Return as JSON:
+{
+    "questions": {
+        "1": "question text here",
+        "2": "question text here"
+    },
+    "user_answers": {
+        "1": "final answer extracted from student's work",
+        "2": "final answer extracted from student's work"
+    }
+}
+
+Even if there's no explicit "Answer:" label, extract the final result from their work. If you see work/steps, the answer is usually the last value or expression written."""
+
+UPLOAD_FALLBACK_PROMPT = """Look at this test content more carefully. Extract ANY final answers or results, even if they're embedded in work.
+
+Find any numbers, expressions, or values that look like final answers (usually at the end of lines, after =, or the last thing written).
+
+Return as JSON with user_answers containing question numbers and their final answers:
+{
+    "user_answers": {
+        "1": "extracted final answer",
+        "2": "extracted final answer"
+    }
+}"""
+
+TEXT_EXTRACT_PROMPT = """You are analyzing a student's test that was pasted as text. Your job is to extract ALL questions and the student's FINAL ANSWERS.
+
+IMPORTANT INSTRUCTIONS:
+1. Extract EVERY question number and its full question text
+2. For each question, find the student's FINAL ANSWER - this could be:
+   - Explicitly stated (e.g., "Answer: 42" or "= 42")
+   - At the end of their work/steps (the last value or expression)
+   - After an equals sign (=) at the conclusion
+   - The result of calculations shown
+   - A conclusion or solution statement
+
+3. For complex math problems:
+   - Look for the final result after all work is shown
+   - If they show steps like "2x + 3 = 7, so x = 2", the answer is "2" or "x = 2"
+   - If they show a derivative calculation ending with "= 2x", the answer is "2x"
+   - If they solve an equation and end with "x = 3 or x = -1", extract that full answer
+
+4. Be intelligent - even if the answer isn't explicitly labeled, infer it from:
+   - The last line of work for that question
+   - The conclusion of their reasoning
+   - The final value after calculations
+   - Any boxed or highlighted result
+
+5. Handle various formats:
+   - "Question 1: ... Answer: ..."
+   - "1. ... [work] = [answer]"
+   - "Problem 1: ... Solution: ..."
+   - Just work with a final answer at the end
+
+Return JSON with BOTH questions and answers:
+{
+  "questions": {
+    "1": "full question text here",
+    "2": "full question text here"
+  },
+  "user_answers": {
+    "1": "student's final answer (extracted intelligently)",
+    "2": "student's final answer (extracted intelligently)"
+  }
+}
+
+Extract ALL questions and their corresponding final answers. Be thorough and intelligent about finding answers even if not explicitly stated."""
+
+TEXT_AGGRESSIVE_PROMPT = """Look at this test content very carefully. The student has provided answers somewhere in their work. Find them.
+
+Even if answers aren't explicitly labeled, extract them from:
+- Final values after calculations
+- Results at the end of work
+- Values after equals signs
+- Conclusions or solutions
+
+Return JSON:
+{
+  "user_answers": {
+    "1": "extracted answer",
+    "2": "extracted answer"
+  }
+}"""
+
+
+# Patterns for the regex fallback parser, compiled once at import
+QUESTION_PATTERN = re.compile(r'(?:Q|Question|Problem|#)?\s*(\d+)[\.:\)]\s*(.+)', re.IGNORECASE)
+ANSWER_PATTERN = re.compile(r'(?:A|Answer|Ans)[\.:\)]\s*(.+)', re.IGNORECASE)
+STEP_PATTERN = re.compile(r'^(?:Step|Solution)', re.IGNORECASE)
+FINAL_EQUALS_PATTERN = re.compile(r'=\s*(.+)$')
+FINAL_VARIABLE_PATTERN = re.compile(r'([a-z])\s*=\s*(.+)$', re.IGNORECASE)
+
+
+def extract_final_answer_from_work(work_lines: List[str]) -> Optional[str]:
+    """
+    Find the student's final answer in the work lines of a question
+    
+    Scans from the last line backwards, so only the tail of long work is touched.
+    """
+    for work_line in reversed(work_lines):
+        # Look for = pattern (final answer)
+        eq_match = FINAL_EQUALS_PATTERN.search(work_line)
+        if eq_match:
+            return eq_match.group(1).strip()
+        # Look for variable = value (e.g., x = 2)
+        var_match = FINAL_VARIABLE_PATTERN.search(work_line)
+        if var_match:
+            return var_match.group(2).strip()
+    return None
+
+
+async def extract_answers(system_prompt: str, user_prompt: str) -> ExtractionResult:
+    """
+    Run one deterministic extraction pass through Groq and parse its JSON reply
+    
+    Args:
+        system_prompt: System message describing the extraction task
+        user_prompt: Instructions followed by the student's content
+        
+    Returns:
+        Extracted questions and answers, decoded straight from the JSON text
+    """
+    response_text = await asyncio.to_thread(
+        completion_text,
+        model=EXTRACTION_MODEL,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=EXTRACTION_TEMPERATURE,
+        seed=EXTRACTION_SEED,
+        response_format={"type": "json_object"}
+    )
+    return ExtractionResult.model_validate_json(response_text)
+
+
+async def ocr_page(img: Image.Image):
+    """
+    OCR one uploaded page: full content (equations + text), then the bottom
+    region where final answers often are
+    
+    The region pass runs second so its full-page pix2tex decode hits the OCR
+    cache filled by extract_all_content instead of repeating it.
+    """
+    content = await run_ocr(latex_ocr.extract_all_content, img)
+    bottom_equations = await run_ocr(latex_ocr.extract_equations_from_regions, img)
+    return content, bottom_equations
+
+
+@app.on_event("startup")
+async def warm_up_ocr():
+    """Start loading the EasyOCR weights while the server begins accepting requests"""
+    if latex_ocr is not None:
+        latex_ocr.start_warmup()
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -208,18 +418,22 @@ async def upload_test(images: List[UploadFile] = File(...), subject: str = Form(
         all_text_content = []
 >>>>>>> parent of c53e3aa (Commiting code into github for desktop, ocr not working, math anlyzation not working, need to fix)
         
-        # Process each image
+        # Read every image up front; load() decodes now so worker threads
+        # never race on PIL's lazy loading
+        pages = []
         for image in images:
-            # Read image
             image_data = await image.read()
             img = Image.open(io.BytesIO(image_data))
-            
-            # Extract all content (equations + text)
-            content = latex_ocr.extract_all_content(img)
+            img.load()
+            pages.append(img)
+        
+        # OCR all pages concurrently on the OCR pool so the event loop keeps
+        # serving other requests
+        ocr_results = await asyncio.gather(*(ocr_page(img) for img in pages))
+        
+        # Process each image
+        for image, (content, bottom_equations) in zip(images, ocr_results):
             all_equations.extend(content["equations"])
-            
-            # Also try to extract equations from bottom region (where final answers often are)
-            bottom_equations = latex_ocr.extract_equations_from_regions(img)
             all_equations.extend(bottom_equations)
             
             if content["full_content"]:
@@ -247,85 +461,27 @@ async def upload_test(images: List[UploadFile] = File(...), subject: str = Form(
         if combined_content.strip():
             try:
                 # Use Groq to parse the test and extract questions and answers
-                parse_prompt = f"""Analyze this test image content and extract all questions and their corresponding answers.
-
-IMPORTANT: The student's work may show steps, calculations, or work. The FINAL ANSWER is usually:
-- The last thing written after all the work
-- The value after an equals sign (=) at the end
-- The final result of calculations shown
-- The conclusion or solution at the end of their work
-
-Content from test image:
-{combined_content}
-
-For each question, extract:
-1. Question number and question text
-2. The student's FINAL ANSWER (extract from their work/steps - look for the final result, not intermediate steps)
-
-Look for patterns like:
-- Question 1: [question text]
-  [student's work/steps]
-  = [final answer]  <- This is what we want
-  
-- Or just the final value/expression at the end of their work
-
-Return as JSON:
-{{
-    "questions": {{
-        "1": "question text here",
-        "2": "question text here"
-    }},
-    "user_answers": {{
-        "1": "final answer extracted from student's work",
-        "2": "final answer extracted from student's work"
-    }}
-}}
-
-Even if there's no explicit "Answer:" label, extract the final result from their work. If you see work/steps, the answer is usually the last value or expression written."""
+                parse_prompt = f"{UPLOAD_PARSE_PROMPT}\n\nContent from test image:\n{combined_content}"
                 
                 if ai_analyzer.use_groq:
-                    response = ai_analyzer.client.chat.completions.create(
-                        model="llama-3.3-70b-versatile",
-                        messages=[
-                            {"role": "system", "content": "You are an expert at parsing test images. Extract questions and FINAL ANSWERS from student work. Look for the last value/expression written, not intermediate steps. Always return valid JSON."},
-                            {"role": "user", "content": parse_prompt}
-                        ],
-                        temperature=0.2,  # Lower temperature for more consistent extraction
-                        response_format={"type": "json_object"}
+                    parsed = await extract_answers(
+                        "You are an expert at parsing test images. Extract questions and FINAL ANSWERS from student work. Look for the last value/expression written, not intermediate steps. Always return valid JSON.",
+                        parse_prompt
                     )
-                    parsed = json.loads(response.choices[0].message.content)
-                    questions = parsed.get("questions", {})
-                    user_answers = parsed.get("user_answers", {})
+                    questions = parsed.questions
+                    user_answers = parsed.user_answers
                     
                     # If still no answers, try a more aggressive extraction
                     if len(user_answers) == 0 and len(combined_content) > 50:
                         # Try to extract any final values/expressions
-                        fallback_prompt = f"""Look at this test content more carefully. Extract ANY final answers or results, even if they're embedded in work.
-
-Content: {combined_content}
-
-Find any numbers, expressions, or values that look like final answers (usually at the end of lines, after =, or the last thing written).
-
-Return as JSON with user_answers containing question numbers and their final answers:
-{{
-    "user_answers": {{
-        "1": "extracted final answer",
-        "2": "extracted final answer"
-    }}
-}}"""
+                        fallback_prompt = f"{UPLOAD_FALLBACK_PROMPT}\n\nContent: {combined_content}"
                         
                         try:
-                            fallback_response = ai_analyzer.client.chat.completions.create(
-                                model="llama-3.3-70b-versatile",
-                                messages=[
-                                    {"role": "system", "content": "Extract final answers from student work. Be aggressive - find any values that could be answers."},
-                                    {"role": "user", "content": fallback_prompt}
-                                ],
-                                temperature=0.3,
-                                response_format={"type": "json_object"}
+                            fallback_parsed = await extract_answers(
+                                "Extract final answers from student work. Be aggressive - find any values that could be answers.",
+                                fallback_prompt
                             )
-                            fallback_parsed = json.loads(fallback_response.choices[0].message.content)
-                            fallback_answers = fallback_parsed.get("user_answers", {})
+                            fallback_answers = fallback_parsed.user_answers
                             if fallback_answers:
                                 user_answers = fallback_answers
                                 print(f"Fallback extraction found {len(user_answers)} answers")
@@ -335,58 +491,38 @@ Return as JSON with user_answers containing question numbers and their final ans
                 print(f"Error parsing test content with AI: {e}")
                 # Fallback: try to extract basic patterns
                 # Look for common patterns like "Q1:", "Question 1:", "1.", etc.
-                import re
                 lines = combined_content.split('\n')
                 current_q = None
                 q_work_lines = {}  # Store work lines for each question
                 
-                for i, line in enumerate(lines):
+                for line in lines:
                     # Look for question patterns
-                    q_match = re.search(r'(?:Q|Question|Problem|#)?\s*(\d+)[\.:\)]\s*(.+)', line, re.IGNORECASE)
+                    q_match = QUESTION_PATTERN.search(line)
                     if q_match:
                         # If we had a previous question, extract final answer from its work
                         if current_q and current_q in q_work_lines:
-                            work = q_work_lines[current_q]
-                            # Look for final answer patterns: = value, or last number/expression
-                            final_ans = None
-                            for work_line in reversed(work):
-                                # Look for = pattern (final answer)
-                                eq_match = re.search(r'=\s*(.+)$', work_line)
-                                if eq_match:
-                                    final_ans = eq_match.group(1).strip()
-                                    break
-                                # Look for variable = value (e.g., x = 2)
-                                var_match = re.search(r'([a-z])\s*=\s*(.+)$', work_line, re.IGNORECASE)
-                                if var_match:
-                                    final_ans = var_match.group(2).strip()
-                                    break
+                            final_ans = extract_final_answer_from_work(q_work_lines[current_q])
                             if final_ans:
                                 user_answers[current_q] = final_ans
                         
                         current_q = q_match.group(1)
                         questions[current_q] = q_match.group(2).strip()
                         q_work_lines[current_q] = []
+                        continue
+                    
                     # Look for explicit answer patterns
-                    elif current_q and re.search(r'(?:A|Answer|Ans)[\.:\)]\s*(.+)', line, re.IGNORECASE):
-                        ans_match = re.search(r'(?:A|Answer|Ans)[\.:\)]\s*(.+)', line, re.IGNORECASE)
-                        if ans_match:
-                            user_answers[current_q] = ans_match.group(1).strip()
+                    ans_match = ANSWER_PATTERN.search(line) if current_q else None
+                    if ans_match:
+                        user_answers[current_q] = ans_match.group(1).strip()
                     # Store work lines for the current question
-                    elif current_q and line.strip() and not re.search(r'^(?:Step|Solution)', line, re.IGNORECASE):
+                    elif current_q and line.strip() and not STEP_PATTERN.search(line):
                         q_work_lines[current_q].append(line.strip())
                 
                 # Extract final answer for last question
                 if current_q and current_q in q_work_lines:
-                    work = q_work_lines[current_q]
-                    for work_line in reversed(work):
-                        eq_match = re.search(r'=\s*(.+)$', work_line)
-                        if eq_match:
-                            user_answers[current_q] = eq_match.group(1).strip()
-                            break
-                        var_match = re.search(r'([a-z])\s*=\s*(.+)$', work_line, re.IGNORECASE)
-                        if var_match:
-                            user_answers[current_q] = var_match.group(2).strip()
-                            break
+                    final_ans = extract_final_answer_from_work(q_work_lines[current_q])
+                    if final_ans:
+                        user_answers[current_q] = final_ans
         
         return ImageUploadResponse(
             test_id=test_id,
@@ -426,6 +562,21 @@ class AnalyzeTextRequest(BaseModel):
     test_id: Optional[str] = None
     text: str
 
+
+class AnalyzeTextBatchRequest(BaseModel):
+    """Several pasted-text analyses submitted in one request"""
+    items: List[AnalyzeTextRequest]
+
+
+class AnalysisBatchItem(BaseModel):
+    """One batch entry: the analysis, or why that item failed"""
+    result: Optional[AnalysisResponse] = None
+    error: Optional[str] = None
+
+
+class AnalysisBatchResponse(BaseModel):
+    results: List[AnalysisBatchItem]
+
 @app.post("/api/analyze-mistakes", response_model=AnalysisResponse)
 async def analyze_mistakes(request: AnalyzeRequest):
     """
@@ -437,7 +588,8 @@ async def analyze_mistakes(request: AnalyzeRequest):
             return AnalysisResponse(
                 test_id=request.test_id,
                 mistakes=[],
-                summary="No answers provided for analysis. Please make sure your test images contain visible answers."
+                summary="No answers provided for analysis. Please make sure your test images contain visible answers.",
+                extraction_succeeded=False
             )
         
 <<<<<<< HEAD
@@ -531,7 +683,8 @@ async def analyze_mistakes(request: AnalyzeRequest):
         return AnalysisResponse(
             test_id=request.test_id,
             mistakes=mistakes,
-            summary=analysis.get("summary", "Analysis complete")
+            summary=analysis.get("summary", "Analysis complete"),
+            analysis_failed=bool(analysis.get("analysis_failed"))
         )
     
     except Exception as e:
@@ -540,116 +693,155 @@ async def analyze_mistakes(request: AnalyzeRequest):
         raise HTTPException(status_code=500, detail=f"Error analyzing mistakes: {str(e)}")
 
 
-@app.post("/api/analyze-text", response_model=AnalysisResponse)
-async def analyze_text(request: AnalyzeTextRequest):
+class AnalysisJobResponse(BaseModel):
+    job_id: str
+    status: str  # "pending", "complete" or "failed"
+    result: Optional[AnalysisResponse] = None
+    error: Optional[str] = None
+
+
+# In-process store of background analyses, keyed by a hash of the submission;
+# once full, the oldest finished or failed jobs are evicted (pending ones stay)
+ANALYSIS_JOBS_SIZE = 256
+analysis_jobs = OrderedDict()
+
+
+def store_analysis_job(job_id: str, job: dict):
+    """Record a job as most recent and trim finished jobs beyond ANALYSIS_JOBS_SIZE"""
+    analysis_jobs[job_id] = job
+    analysis_jobs.move_to_end(job_id)
+    excess = len(analysis_jobs) - ANALYSIS_JOBS_SIZE
+    if excess <= 0:
+        return
+    for old_id, old_job in list(analysis_jobs.items()):
+        if excess <= 0:
+            break
+        if old_job["status"] != "pending":
+            del analysis_jobs[old_id]
+            excess -= 1
+
+
+def analysis_job_key(request: AnalyzeRequest) -> str:
+    """Idempotency key for an analysis request, so duplicate submissions share one job"""
+    payload = orjson.dumps(
+        [request.test_id, request.user_answers, request.questions, request.subject, request.correct_answers],
+        option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+    )
+    return hashlib.sha256(payload).hexdigest()
+
+
+async def run_analysis_job(job: dict, request: AnalyzeRequest):
+    """Run a queued analysis and record its outcome on its job entry"""
+    try:
+        result = await analyze_mistakes(request)
+        # A failed LLM call is a failed job, so an identical resubmission retries it
+        if result.analysis_failed:
+            job["error"] = result.summary
+            job["status"] = "failed"
+        else:
+            job["result"] = result
+            job["status"] = "complete"
+    except HTTPException as e:
+        job["error"] = str(e.detail)
+        job["status"] = "failed"
+    except Exception as e:
+        job["error"] = str(e)
+        job["status"] = "failed"
+
+
+@app.post("/api/analyze-mistakes/jobs", response_model=AnalysisJobResponse)
+async def enqueue_analyze_mistakes(request: AnalyzeRequest, background_tasks: BackgroundTasks):
     """
-    Analyze mistakes from raw pasted text (questions/answers)
-    Intelligently extracts questions and answers, even from complex math problems
+    Queue a mistake analysis and return a job id to poll instead of blocking on the LLM
     """
-    if not request.text or not request.text.strip():
-        raise HTTPException(status_code=400, detail="No text provided for analysis")
+    job_id = analysis_job_key(request)
+    job = analysis_jobs.get(job_id)
+    
+    # Identical submissions collapse onto the existing job; failed jobs are retried
+    if job is None or job["status"] == "failed":
+        job = {"status": "pending", "result": None, "error": None}
+        background_tasks.add_task(run_analysis_job, job, request)
+    store_analysis_job(job_id, job)
+    
+    return AnalysisJobResponse(job_id=job_id, **job)
 
-    extract_prompt = f"""You are analyzing a student's test that was pasted as text. Your job is to extract ALL questions and the student's FINAL ANSWERS.
 
-IMPORTANT INSTRUCTIONS:
-1. Extract EVERY question number and its full question text
-2. For each question, find the student's FINAL ANSWER - this could be:
-   - Explicitly stated (e.g., "Answer: 42" or "= 42")
-   - At the end of their work/steps (the last value or expression)
-   - After an equals sign (=) at the conclusion
-   - The result of calculations shown
-   - A conclusion or solution statement
+@app.get("/api/jobs/{job_id}", response_model=AnalysisJobResponse)
+async def get_analysis_job(job_id: str):
+    """
+    Poll the status of a queued mistake analysis
+    """
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return AnalysisJobResponse(job_id=job_id, **job)
 
-3. For complex math problems:
-   - Look for the final result after all work is shown
-   - If they show steps like "2x + 3 = 7, so x = 2", the answer is "2" or "x = 2"
-   - If they show a derivative calculation ending with "= 2x", the answer is "2x"
-   - If they solve an equation and end with "x = 3 or x = -1", extract that full answer
 
-4. Be intelligent - even if the answer isn't explicitly labeled, infer it from:
-   - The last line of work for that question
-   - The conclusion of their reasoning
-   - The final value after calculations
-   - Any boxed or highlighted result
+# Completed pasted-text analyses keyed by a hash of the text; CACHE_DISABLE=1 turns it off
+TEXT_ANALYSIS_CACHE_SIZE = 256
+TEXT_ANALYSIS_CACHE_ENABLED = os.getenv("CACHE_DISABLE") != "1"
+text_analysis_cache = OrderedDict()
 
-5. Handle various formats:
-   - "Question 1: ... Answer: ..."
-   - "1. ... [work] = [answer]"
-   - "Problem 1: ... Solution: ..."
-   - Just work with a final answer at the end
 
-Return JSON with BOTH questions and answers:
-{{
-  "questions": {{
-    "1": "full question text here",
-    "2": "full question text here"
-  }},
-  "user_answers": {{
-    "1": "student's final answer (extracted intelligently)",
-    "2": "student's final answer (extracted intelligently)"
-  }}
-}}
+def remember_text_analysis(cache_key: str, mistakes: list, summary: str, extraction_succeeded: bool = True):
+    """Store a finished text analysis; callers skip this on failures so they are retried"""
+    if not TEXT_ANALYSIS_CACHE_ENABLED:
+        return
+    text_analysis_cache[cache_key] = {
+        "mistakes": mistakes,
+        "summary": summary,
+        "extraction_succeeded": extraction_succeeded
+    }
+    if len(text_analysis_cache) > TEXT_ANALYSIS_CACHE_SIZE:
+        text_analysis_cache.popitem(last=False)
 
-Pasted test content:
-{request.text}
 
-Extract ALL questions and their corresponding final answers. Be thorough and intelligent about finding answers even if not explicitly stated."""
+@app.post("/api/analyze-text", response_model=AnalysisResponse)
+async def analyze_text(request: AnalyzeTextRequest):
+    """
+    Analyze mistakes from raw pasted text (questions/answers)
+    Intelligently extracts questions and answers, even from complex math problems
+    """
+    if not request.text or not request.text.strip():
+        raise HTTPException(status_code=400, detail="No text provided for analysis")
+
+    # Identical text was analyzed before; skip both LLM passes
+    cache_key = hashlib.sha256(request.text.encode()).hexdigest()
+    cached = text_analysis_cache.get(cache_key) if TEXT_ANALYSIS_CACHE_ENABLED else None
+    if cached is not None:
+        text_analysis_cache.move_to_end(cache_key)
+        return AnalysisResponse(test_id=request.test_id or "text-analysis", **cached)
+
+    extract_prompt = f"{TEXT_EXTRACT_PROMPT}\n\nPasted test content:\n{request.text}"
 
     try:
         if not ai_analyzer.use_groq:
             raise HTTPException(status_code=500, detail="AI service not configured. Please set GROQ_API_KEY")
 
         # First extraction pass - get questions and answers
-        response = ai_analyzer.client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": "You are an expert at parsing test content. Extract ALL questions and intelligently determine the student's final answers, even from complex math work. Always return valid JSON with both questions and user_answers."},
-                {"role": "user", "content": extract_prompt},
-            ],
-            temperature=0.2,
-            response_format={"type": "json_object"}
+        parsed = await extract_answers(
+            "You are an expert at parsing test content. Extract ALL questions and intelligently determine the student's final answers, even from complex math work. Always return valid JSON with both questions and user_answers.",
+            extract_prompt
         )
-        parsed = json.loads(response.choices[0].message.content)
-        user_answers = parsed.get("user_answers", {})
-        questions = parsed.get("questions", {})
+        user_answers = parsed.user_answers
+        questions = parsed.questions
         
         # If no answers found, try a more aggressive extraction
+        aggressive_failed = False
         if not user_answers and len(request.text) > 50:
-            aggressive_prompt = f"""Look at this test content very carefully. The student has provided answers somewhere in their work. Find them.
-
-Content:
-{request.text}
-
-Even if answers aren't explicitly labeled, extract them from:
-- Final values after calculations
-- Results at the end of work
-- Values after equals signs
-- Conclusions or solutions
-
-Return JSON:
-{{
-  "user_answers": {{
-    "1": "extracted answer",
-    "2": "extracted answer"
-  }}
-}}"""
+            aggressive_prompt = f"{TEXT_AGGRESSIVE_PROMPT}\n\nContent:\n{request.text}"
             
             try:
-                aggressive_response = ai_analyzer.client.chat.completions.create(
-                    model="llama-3.3-70b-versatile",
-                    messages=[
-                        {"role": "system", "content": "Be very aggressive in finding answers. Extract any final values, results, or conclusions from the student's work."},
-                        {"role": "user", "content": aggressive_prompt},
-                    ],
-                    temperature=0.3,
-                    response_format={"type": "json_object"}
+                aggressive_parsed = await extract_answers(
+                    "Be very aggressive in finding answers. Extract any final values, results, or conclusions from the student's work.",
+                    aggressive_prompt
                 )
-                aggressive_parsed = json.loads(aggressive_response.choices[0].message.content)
-                aggressive_answers = aggressive_parsed.get("user_answers", {})
+                aggressive_answers = aggressive_parsed.user_answers
                 if aggressive_answers:
                     user_answers = aggressive_answers
                     print(f"Aggressive extraction found {len(user_answers)} answers")
             except Exception as e:
+                aggressive_failed = True
                 print(f"Aggressive extraction failed: {e}")
         
     except HTTPException:
@@ -660,10 +852,15 @@ Return JSON:
         raise HTTPException(status_code=500, detail=f"Error extracting answers from text: {str(e)}")
 
     if not user_answers:
+        summary = "No answers could be extracted from the provided text. Please ensure the text includes questions and answers (or work that shows final results)."
+        # A failed aggressive pass may be transient; only cache a genuine miss
+        if not aggressive_failed:
+            remember_text_analysis(cache_key, [], summary, extraction_succeeded=False)
         return AnalysisResponse(
             test_id=request.test_id or "text-analysis",
             mistakes=[],
-            summary="No answers could be extracted from the provided text. Please ensure the text includes questions and answers (or work that shows final results)."
+            summary=summary,
+            extraction_succeeded=False
         )
 
     # Run analysis on extracted answers
@@ -672,14 +869,51 @@ Return JSON:
         user_answers=user_answers,
         correct_answers=None
     )
+    mistakes = analysis.get("mistakes", [])
+    summary = analysis.get("summary", "Analysis complete")
+    if not analysis.get("analysis_failed"):
+        remember_text_analysis(cache_key, mistakes, summary)
 
     return AnalysisResponse(
         test_id=request.test_id or "text-analysis",
-        mistakes=analysis.get("mistakes", []),
-        summary=analysis.get("summary", "Analysis complete")
+        mistakes=mistakes,
+        summary=summary
     )
 
 
+# Upper bound on pasted texts per batch request; each item costs up to three LLM calls
+TEXT_BATCH_MAX_ITEMS = 10
+
+
+@app.post("/api/analyze-text-batch", response_model=AnalysisBatchResponse)
+async def analyze_text_batch(request: AnalyzeTextBatchRequest):
+    """
+    Analyze several pasted texts in one round trip
+    All items are submitted at once and their LLM calls overlap; results keep the request order
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="No items provided for analysis")
+    if len(request.items) > TEXT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {TEXT_BATCH_MAX_ITEMS} items can be analyzed per batch")
+    
+    # Reject bad input before any LLM call starts
+    empty_items = [index for index, item in enumerate(request.items) if not item.text or not item.text.strip()]
+    if empty_items:
+        raise HTTPException(status_code=400, detail=f"No text provided for items: {empty_items}")
+    
+    # A failing item is reported in its slot instead of failing the whole batch
+    outcomes = await asyncio.gather(*(analyze_text(item) for item in request.items), return_exceptions=True)
+    results = []
+    for outcome in outcomes:
+        if isinstance(outcome, HTTPException):
+            results.append(AnalysisBatchItem(error=str(outcome.detail)))
+        elif isinstance(outcome, Exception):
+            results.append(AnalysisBatchItem(error=str(outcome)))
+        else:
+            results.append(AnalysisBatchItem(result=outcome))
+    return AnalysisBatchResponse(results=results)
+
+
 class PracticeRequest(BaseModel):
     test_id: str
     mistake_ids: List[str]
@@ -937,7 +1171,7 @@ async def submit_practice_answer(
         img = Image.open(io.BytesIO(image_data))
         
         # Extract answer using OCR
-        answer_equations = latex_ocr.extract_equations(img)
+        answer_equations = await run_ocr(latex_ocr.extract_equations, img)
         
         # If no equations extracted, use a placeholder
         if not answer_equations:
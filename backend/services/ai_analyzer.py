@@ -2,27 +2,199 @@
 AI Service for analyzing mistakes and providing feedback
 """
 import os
+import asyncio
 from typing import List, Dict, Optional
-import json
+import orjson
 from dotenv import load_dotenv
+from pydantic import ValidationError
+
+from database.schemas import AnalyzedMistake
 
 # Load environment variables
 load_dotenv()
 
+# orjson options used when embedding answer dicts in prompts
+JSON_INDENT_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+
+# Characters OCR commonly confuses, mapped to the digit they were misread from
+OCR_CONFUSION_TABLE = str.maketrans({"O": "0", "o": "0", "l": "1", "I": "1", "S": "5", "Z": "2", "B": "8"})
+
+
+def normalize_answer(answer) -> str:
+    """Canonical form of an answer for exact comparison, folding common OCR confusions"""
+    return str(answer).translate(OCR_CONFUSION_TABLE).replace(" ", "").lower()
+
+
+def select_answers_for_review(user_answers: dict, correct_answers: Optional[dict]) -> tuple:
+    """
+    Pick the answers the LLM still has to analyze
+    
+    Without an answer key every answer is returned as given. With one, answers
+    matching the key after normalize_answer are dropped, a keyed question the
+    student left blank counts as a mismatch (empty answer), and answers with no
+    key entry are kept.
+    
+    Args:
+        user_answers: Question number to the student's answer
+        correct_answers: Optional question number to correct answer
+        
+    Returns:
+        (answers, correct answers) for the prompt; answers is empty when
+        everything matched the key
+    """
+    if not correct_answers:
+        return user_answers, correct_answers
+    
+    # Key by string question number, so int-keyed dicts still match
+    answers_by_question = {str(k): v for k, v in user_answers.items()}
+    correct_by_question = {str(k): v for k, v in correct_answers.items()}
+    
+    review_answers = {
+        q_key: answers_by_question.get(q_key, "")
+        for q_key, correct in correct_by_question.items()
+        if q_key not in answers_by_question
+        or normalize_answer(answers_by_question[q_key]) != normalize_answer(correct)
+    }
+    review_answers.update(
+        (q_key, answer) for q_key, answer in answers_by_question.items()
+        if q_key not in correct_by_question
+    )
+    review_correct = {
+        q_key: correct_by_question[q_key] for q_key in review_answers
+        if q_key in correct_by_question
+    }
+    return review_answers, review_correct
+
+
+ANALYSIS_PROMPT_HEADER = """You are analyzing a student's test. Analyze the following answers and identify any mistakes.
+
+Student's Answers:
+"""
+
+ANALYSIS_PROMPT_NO_KEY = (
+    "\nEven without correct answers provided, analyze each answer for:\n"
+    "- Mathematical errors (wrong calculations, formula mistakes)\n"
+    "- Conceptual errors (misunderstanding of concepts)\n"
+    "- Common mistakes in the subject area\n"
+    "If an answer looks correct based on standard knowledge, don't mark it as a mistake."
+)
+
+ANALYSIS_PROMPT_FOOTER = """
+For each mistake you identify, provide:
+1. Question number (as integer)
+2. What the student did wrong (detailed description)
+3. Why it's wrong (explanation of the error)
+4. How to fix it (step-by-step correction)
+5. The concept/topic that needs improvement
+
+IMPORTANT: 
+- Only identify actual mistakes, not correct answers
+- If all answers appear correct, return an empty mistakes array
+- Question numbers must match the keys in user_answers (convert to integers)
+
+Return your analysis as JSON with this EXACT structure:
+{
+    "mistakes": [
+        {
+            "question_number": 1,
+            "mistake_description": "detailed description of what went wrong",
+            "why_wrong": "explanation of why this is incorrect",
+            "how_to_fix": "step-by-step correction",
+            "weak_area": "topic/concept name"
+        }
+    ],
+    "summary": "Overall summary of the student's performance"
+}
+"""
+
+
+PRACTICE_PROMPT_FOOTER = """
+
+Analyze if the student's answer is correct.
+Provide:
+1. Is the answer correct? (true/false)
+2. Detailed feedback on what they did right or wrong
+3. Step-by-step explanation of the solution
+
+Return as JSON:
+{
+    "is_correct": true/false,
+    "feedback": "detailed feedback",
+    "explanation": "step-by-step explanation"
+}
+"""
+
+
+def compose_analysis_prompt(answers_json: str, correct_json: str) -> str:
+    """Assemble the analysis prompt from serialized answers around the static prompt text"""
+    prompt = f"{ANALYSIS_PROMPT_HEADER}{answers_json}\n"
+    if correct_json:
+        prompt += f"\nCorrect Answers (for reference):\n{correct_json}\n"
+        prompt += "\nCompare the student's answers with the correct answers and identify all mistakes."
+    else:
+        prompt += ANALYSIS_PROMPT_NO_KEY
+    return prompt + ANALYSIS_PROMPT_FOOTER
+
+
+# HTTP/2 needs the optional h2 package (pulled in by httpx[http2], not by groq);
+# without it the shared client stays on HTTP/1.1 instead of failing to start
+try:
+    import h2  # noqa: F401
+    HAS_HTTP2 = True
+except ImportError:
+    HAS_HTTP2 = False
+
 # Use Groq API
 try:
-    from groq import Groq
+    import httpx
+    from groq import AsyncGroq, Groq
     api_key = os.getenv("GROQ_API_KEY")
     if api_key:
-        client = Groq(api_key=api_key)
+        # One pooled client shared by every analysis and the extraction passes in main.py
+        http_client = httpx.Client(
+            http2=HAS_HTTP2,
+            timeout=httpx.Timeout(60.0),
+            limits=httpx.Limits(max_keepalive_connections=20)
+        )
+        client = Groq(api_key=api_key, http_client=http_client)
+        # Async twin for coroutine callers, so timeouts and cancellation reach the HTTP call
+        async_client = AsyncGroq(api_key=api_key, http_client=httpx.AsyncClient(
+            http2=HAS_HTTP2,
+            timeout=httpx.Timeout(60.0),
+            limits=httpx.Limits(max_keepalive_connections=20)
+        ))
         USE_GROQ = True
     else:
         USE_GROQ = False
         client = None
+        async_client = None
 except Exception as e:
     print(f"Warning: Could not initialize Groq client: {e}")
     USE_GROQ = False
     client = None
+    async_client = None
+
+
+def completion_content(response) -> str:
+    """Message text of a chat completion, rejecting replies cut off by the token limit"""
+    choice = response.choices[0]
+    if choice.finish_reason == "length":
+        raise ValueError("Completion was truncated at the token limit")
+    return choice.message.content or ""
+
+
+def completion_text(**kwargs) -> str:
+    """
+    Run a chat completion on the shared Groq client and return its message content
+    
+    Blocking; call through asyncio.to_thread from async code.
+    """
+    return completion_content(client.chat.completions.create(**kwargs))
+
+
+async def async_completion_text(**kwargs) -> str:
+    """Run a chat completion on the shared AsyncGroq client and return its message content"""
+    return completion_content(await async_client.chat.completions.create(**kwargs))
 
 
 class AIAnalyzer:
@@ -47,7 +219,8 @@ class AIAnalyzer:
             correct_answers: Optional dictionary with correct answers
             
         Returns:
-            Dictionary with mistakes list and summary
+            Dictionary with mistakes list and summary; analysis_failed is set
+            when the LLM could not produce a usable analysis
         """
         # Validate input
         if not user_answers or len(user_answers) == 0:
@@ -56,15 +229,28 @@ class AIAnalyzer:
                 "summary": "No answers provided for analysis. Please upload test images with visible answers."
             }
         
+        # Key answers by string question number, so mistakes map back to int-keyed dicts too
+        answers_by_question = {str(k): v for k, v in user_answers.items()}
+        correct_by_question = {str(k): v for k, v in correct_answers.items()} if correct_answers else {}
+        
+        # With an answer key, only mismatched or unkeyed answers need the LLM
+        prompt_answers, prompt_correct = select_answers_for_review(user_answers, correct_answers)
+        if not prompt_answers:
+            return {
+                "mistakes": [],
+                "summary": "All answers correct."
+            }
+        
         if not self.client:
             # Fallback response if AI is not configured
             return {
                 "mistakes": [],
-                "summary": "AI service not configured. Please set GROQ_API_KEY"
+                "summary": "AI service not configured. Please set GROQ_API_KEY",
+                "analysis_failed": True
             }
         
         # Build prompt for mistake analysis
-        prompt = self._build_analysis_prompt(user_answers, correct_answers)
+        prompt = self._build_analysis_prompt(prompt_answers, prompt_correct)
         
         if not prompt:
             return {
@@ -74,7 +260,9 @@ class AIAnalyzer:
         
         try:
             if self.use_groq:
-                response = self.client.chat.completions.create(
+                # The Groq client is blocking; keep the event loop free for other requests
+                result = await asyncio.to_thread(
+                    completion_text,
                     model="llama-3.3-70b-versatile",
                     messages=[
                         {"role": "system", "content": "You are an expert math and physics tutor. Analyze student mistakes and provide detailed feedback. Always return valid JSON with the exact structure requested."},
@@ -83,69 +271,63 @@ class AIAnalyzer:
                     temperature=0.3,
                     response_format={"type": "json_object"}
                 )
-                result = response.choices[0].message.content
             else:
                 return {
                     "mistakes": [],
-                    "summary": "AI service not available"
+                    "summary": "AI service not available",
+                    "analysis_failed": True
                 }
         except Exception as e:
             print(f"Error calling Groq API: {e}")
             return {
                 "mistakes": [],
-                "summary": f"Error analyzing mistakes: {str(e)}"
+                "summary": f"Error analyzing mistakes: {str(e)}",
+                "analysis_failed": True
             }
         
         # Parse response
         try:
-            analysis = json.loads(result)
+            analysis = orjson.loads(result)
             
             # Validate and clean mistakes
             mistakes = analysis.get("mistakes", [])
             if not isinstance(mistakes, list):
                 mistakes = []
             
-            # Ensure all mistakes have required fields and correct types
+            # Validate each mistake against the expected schema, dropping malformed entries
             cleaned_mistakes = []
             for mistake in mistakes:
-                if isinstance(mistake, dict):
-                    # Convert question_number to int if it's a string
-                    q_num = mistake.get("question_number")
-                    if isinstance(q_num, str):
-                        try:
-                            q_num = int(q_num)
-                        except:
-                            continue
-                    elif not isinstance(q_num, int):
-                        continue
-                    
-                    cleaned_mistakes.append({
-                        "question_number": q_num,
-                        "mistake_description": str(mistake.get("mistake_description", "")),
-                        "why_wrong": str(mistake.get("why_wrong", "")),
-                        "how_to_fix": str(mistake.get("how_to_fix", "")),
-                        "weak_area": str(mistake.get("weak_area", "Unknown")),
-                        "user_answer": user_answers.get(str(q_num), ""),
-                        "correct_answer": correct_answers.get(str(q_num), "") if correct_answers else ""
-                    })
+                try:
+                    validated = AnalyzedMistake.model_validate(mistake)
+                except ValidationError:
+                    continue
+                
+                q_key = str(validated.question_number)
+                cleaned_mistakes.append({
+                    **validated.model_dump(),
+                    "user_answer": answers_by_question.get(q_key, ""),
+                    "correct_answer": correct_by_question.get(q_key, "")
+                })
             
             return {
                 "mistakes": cleaned_mistakes,
                 "summary": analysis.get("summary", "Analysis complete")
             }
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             print(f"Error parsing JSON response: {e}")
             print(f"Response was: {result[:500]}")
             # Try to extract mistakes from text
             return {
                 "mistakes": self._parse_text_response(result),
-                "summary": result[:500] if result else "Could not parse analysis response"
+                "summary": result[:500] if result else "Could not parse analysis response",
+                "analysis_failed": True
             }
         except Exception as e:
             print(f"Error processing analysis: {e}")
             return {
                 "mistakes": [],
-                "summary": f"Error processing analysis: {str(e)}"
+                "summary": f"Error processing analysis: {str(e)}",
+                "analysis_failed": True
             }
     
     def _build_analysis_prompt(self, user_answers: dict, correct_answers: Optional[dict]) -> str:
@@ -153,50 +335,9 @@ class AIAnalyzer:
         if not user_answers or len(user_answers) == 0:
             return ""
         
-        prompt = f"""You are analyzing a student's test. Analyze the following answers and identify any mistakes.
-
-Student's Answers:
-{json.dumps(user_answers, indent=2)}
-"""
-        
-        if correct_answers and len(correct_answers) > 0:
-            prompt += f"\nCorrect Answers (for reference):\n{json.dumps(correct_answers, indent=2)}\n"
-            prompt += "\nCompare the student's answers with the correct answers and identify all mistakes."
-        else:
-            prompt += "\nEven without correct answers provided, analyze each answer for:\n"
-            prompt += "- Mathematical errors (wrong calculations, formula mistakes)\n"
-            prompt += "- Conceptual errors (misunderstanding of concepts)\n"
-            prompt += "- Common mistakes in the subject area\n"
-            prompt += "If an answer looks correct based on standard knowledge, don't mark it as a mistake."
-        
-        prompt += """
-For each mistake you identify, provide:
-1. Question number (as integer)
-2. What the student did wrong (detailed description)
-3. Why it's wrong (explanation of the error)
-4. How to fix it (step-by-step correction)
-5. The concept/topic that needs improvement
-
-IMPORTANT: 
-- Only identify actual mistakes, not correct answers
-- If all answers appear correct, return an empty mistakes array
-- Question numbers must match the keys in user_answers (convert to integers)
-
-Return your analysis as JSON with this EXACT structure:
-{
-    "mistakes": [
-        {
-            "question_number": 1,
-            "mistake_description": "detailed description of what went wrong",
-            "why_wrong": "explanation of why this is incorrect",
-            "how_to_fix": "step-by-step correction",
-            "weak_area": "topic/concept name"
-        }
-    ],
-    "summary": "Overall summary of the student's performance"
-}
-"""
-        return prompt
+        answers_json = orjson.dumps(user_answers, option=JSON_INDENT_OPTIONS).decode()
+        correct_json = orjson.dumps(correct_answers, option=JSON_INDENT_OPTIONS).decode() if correct_answers else ""
+        return compose_analysis_prompt(answers_json, correct_json)
     
     def _parse_text_response(self, text: str) -> List[Dict]:
         """Parse text response into structured mistakes"""
@@ -224,6 +365,16 @@ Return your analysis as JSON with this EXACT structure:
         Returns:
             Dictionary with correctness, feedback, and explanation
         """
+        # Exact match after OCR normalization needs no LLM call
+        if correct_answer:
+            normalized_correct = normalize_answer(correct_answer)
+            if any(normalize_answer(equation) == normalized_correct for equation in submitted_answer):
+                return {
+                    "is_correct": True,
+                    "feedback": "Correct! Your answer matches the expected answer.",
+                    "explanation": ""
+                }
+        
         if not self.client:
             return {
                 "is_correct": False,
@@ -232,33 +383,13 @@ Return your analysis as JSON with this EXACT structure:
             }
         
         # Build prompt with question context if available
-        prompt_parts = []
-        
-        if question_text:
-            prompt_parts.append(f"Practice Question:\n{question_text}\n")
-        
-        prompt_parts.append(f"Student's Submitted Answer:\n{json.dumps(submitted_answer, indent=2)}")
-        
-        if correct_answer:
-            prompt_parts.append(f"\nCorrect Answer (for reference):\n{correct_answer}")
-        
-        prompt_parts.append("\nAnalyze if the student's answer is correct.")
-        prompt_parts.append("Provide:")
-        prompt_parts.append("1. Is the answer correct? (true/false)")
-        prompt_parts.append("2. Detailed feedback on what they did right or wrong")
-        prompt_parts.append("3. Step-by-step explanation of the solution")
-        
-        prompt = "\n".join(prompt_parts)
-        
-        prompt += """
-        
-Return as JSON:
-{
-    "is_correct": true/false,
-    "feedback": "detailed feedback",
-    "explanation": "step-by-step explanation"
-}
-"""
+        question_section = f"Practice Question:\n{question_text}\n\n" if question_text else ""
+        correct_section = f"\n\nCorrect Answer (for reference):\n{correct_answer}" if correct_answer else ""
+        prompt = (
+            f"{question_section}Student's Submitted Answer:\n"
+            f"{orjson.dumps(submitted_answer, option=JSON_INDENT_OPTIONS).decode()}"
+            f"{correct_section}{PRACTICE_PROMPT_FOOTER}"
+        )
         
         if self.use_groq:
             response = self.client.chat.completions.create(
@@ -273,7 +404,7 @@ Return as JSON:
             result = response.choices[0].message.content
         
         try:
-            parsed = json.loads(result)
+            parsed = orjson.loads(result)
             # Ensure all required fields are present
             return {
                 "is_correct": parsed.get("is_correct", False),
@@ -2,7 +2,15 @@
 LaTeX OCR Service using pix2tex
 """
 from PIL import Image
-from typing import List, Optional
+from typing import Callable, List, Optional
+from collections import OrderedDict
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import re
+import threading
+import time
 import numpy as np
 
 try:
@@ -18,49 +26,288 @@ except ImportError:
     print("Warning: pix2tex not installed. Install with: pip install pix2tex[api]")
     LatexOCR = None
 
+# Number of OCR results kept per service, keyed by image content hash
+OCR_CACHE_SIZE = 256
+
+# Longest image side passed to the OCR engines (EasyOCR's own default canvas size)
+MAX_OCR_LONG_SIDE = 1600
+
+
+def downscale_image(image: Image.Image, max_long_side: int) -> Image.Image:
+    """Shrink an image so its longest side is at most max_long_side, keeping aspect ratio"""
+    width, height = image.size
+    scale = max_long_side / max(width, height)
+    if scale >= 1:
+        return image
+    return image.resize((max(1, int(width * scale)), max(1, int(height * scale))), Image.LANCZOS)
+
+
+def otsu_threshold(gray: np.ndarray) -> np.ndarray:
+    """Binarize a grayscale uint8 array with Otsu's method, using numpy only"""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256, dtype=np.float64)
+    
+    # Pixel counts and intensity sums below/above every candidate threshold
+    weight_bg = np.cumsum(hist)
+    weight_fg = weight_bg[-1] - weight_bg
+    sum_bg = np.cumsum(hist * levels)
+    mean_bg = sum_bg / np.maximum(weight_bg, 1)
+    mean_fg = (sum_bg[-1] - sum_bg) / np.maximum(weight_fg, 1)
+    
+    # Pick the threshold that maximizes between-class variance
+    between_class = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    threshold = int(np.argmax(between_class))
+    return np.where(gray > threshold, 255, 0).astype(np.uint8)
+
+
+# Tesseract LSTM engine only, reading the page as one uniform block of text
+TESSERACT_CONFIG = "--oem 1 --psm 6"
+
+# Length-weighted EasyOCR confidence at or above which the Tesseract fallback is skipped
+MIN_TEXT_CONFIDENCE = 0.4
+
+
+def read_tesseract(image: Image.Image) -> tuple:
+    """
+    Run Tesseract on an image
+    
+    Returns:
+        Recognized text with its line breaks, and the word confidence (0-1)
+        weighted by word length; ("", 0.0) when nothing was read
+    """
+    import pytesseract
+    data = pytesseract.image_to_data(image, config=TESSERACT_CONFIG, output_type=pytesseract.Output.DICT)
+    
+    lines = {}
+    confidences = []
+    lengths = []
+    for word, conf, *line_key in zip(data["text"], data["conf"], data["block_num"], data["par_num"], data["line_num"]):
+        word = word.strip()
+        conf = float(conf)
+        # Structural rows (pages, blocks, lines) carry no text and a -1 confidence
+        if not word or conf < 0:
+            continue
+        lines.setdefault(tuple(line_key), []).append(word)
+        confidences.append(conf / 100)
+        lengths.append(len(word))
+    
+    if not confidences:
+        return "", 0.0
+    text = "\n".join(" ".join(words) for words in lines.values())
+    return text, float(np.average(confidences, weights=lengths))
+
+# Share of the page's ink in the bottom crop above which the crop alone is decoded
+BOTTOM_REGION_INK_RATIO = 0.6
+
+
+def count_ink_pixels(processed: np.ndarray) -> int:
+    """Count dark (written) pixels in a preprocessed, dark-on-light image"""
+    return int(np.count_nonzero(processed < 128))
+
+
+# Fewer dark (or light) pixels than this after binarization means the page is blank
+MIN_INK_PIXELS = 50
+
+# Grayscale spread between the 0.1st and 99.9th percentiles below which a page is
+# blank paper; Otsu splits even paper grain into "ink", so this runs before it
+MIN_PAGE_CONTRAST = 40
+
+
+def is_low_contrast(gray: np.ndarray) -> bool:
+    """Whether a grayscale image has too little tonal range to hold any writing"""
+    low, high = np.percentile(gray, (0.1, 99.9))
+    return high - low < MIN_PAGE_CONTRAST
+
+
+def is_blank(processed: np.ndarray) -> bool:
+    """Whether a binarized image is effectively empty (all paper or all ink)"""
+    ink = count_ink_pixels(processed)
+    return ink < MIN_INK_PIXELS or ink > processed.size - MIN_INK_PIXELS
+
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def dedupe_equations(equations: List[str]) -> List[str]:
+    """Remove duplicate LaTeX, treating equations that differ only in whitespace as equal"""
+    if len(equations) < 2:
+        return equations
+    
+    seen = set()
+    unique = []
+    for equation in equations:
+        key = WHITESPACE_PATTERN.sub("", equation)
+        if key not in seen:
+            seen.add(key)
+            unique.append(equation)
+    return unique
+
+
+# Runs pix2tex alongside the text engines in extract_all_content; kept separate
+# from OCR_EXECUTOR so a saturated pool can't wait on itself
+_EQUATION_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pix2tex")
+
+# Dedicated pool for request-level OCR calls, so long pix2tex/EasyOCR runs never
+# starve the event loop's default executor used by other blocking work
+OCR_EXECUTOR = ThreadPoolExecutor(max_workers=max(4, os.cpu_count() or 1), thread_name_prefix="ocr")
+
+
+async def run_ocr(fn: Callable, *args):
+    """Run a blocking OCR call on OCR_EXECUTOR without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(OCR_EXECUTOR, fn, *args)
+
+
+class SerializedModel:
+    """
+    Proxy that lets one thread at a time run inference on a shared model
+    
+    pix2tex switches the process working directory (os.chdir) while it runs
+    and keeps per-call state on the model, and EasyOCR makes no thread-safety
+    promise either, so pages may be OCR'd in parallel but each engine is not.
+    """
+    
+    def __init__(self, model):
+        self.model = model
+        self._lock = threading.Lock()
+    
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            return self.model(*args, **kwargs)
+    
+    def readtext(self, *args, **kwargs):
+        with self._lock:
+            return self.model.readtext(*args, **kwargs)
+
+
+# EasyOCR reader shared by every service instance, since its weights take seconds to load
+_EASYOCR_READER = None
+_EASYOCR_LOCK = threading.Lock()
+
+
+def get_easyocr_reader():
+    """Return the process-wide EasyOCR reader, building it on first use"""
+    global _EASYOCR_READER
+    if _EASYOCR_READER is None:
+        with _EASYOCR_LOCK:
+            if _EASYOCR_READER is None:
+                import easyocr
+                print("Initializing EasyOCR for handwriting recognition...")
+                # Initialize with English, no GPU, quiet mode
+                _EASYOCR_READER = SerializedModel(easyocr.Reader(['en'], gpu=False, verbose=False))
+                print("EasyOCR initialized successfully")
+    return _EASYOCR_READER
+
+
+# pix2tex model shared by every service instance
+_LATEX_MODEL = None
+_LATEX_MODEL_LOCK = threading.Lock()
+
+
+def compile_latex_model(model):
+    """
+    Wrap the pix2tex encoder in torch.compile when OCR_TORCH_COMPILE is set
+    
+    Opt-in because compilation adds startup time and needs torch 2.x; the
+    first OCR call after startup also pays the compile.
+    """
+    if os.getenv("OCR_TORCH_COMPILE", "").lower() not in ("1", "true", "yes"):
+        return model
+    
+    try:
+        import torch
+        model.model.encoder = torch.compile(model.model.encoder)
+        print("pix2tex encoder compiled with torch.compile")
+    except Exception as e:
+        print(f"Warning: Could not torch.compile pix2tex: {e}")
+    return model
+
+
+def get_latex_model():
+    """Return the process-wide pix2tex model, building it on first use"""
+    global _LATEX_MODEL
+    if _LATEX_MODEL is None and LatexOCR:
+        with _LATEX_MODEL_LOCK:
+            if _LATEX_MODEL is None:
+                _LATEX_MODEL = SerializedModel(compile_latex_model(LatexOCR()))
+    return _LATEX_MODEL
+
 
 class LatexOCRService:
     """Service for extracting LaTeX equations from images"""
     
-    def __init__(self):
+    def __init__(self, max_long_side: int = MAX_OCR_LONG_SIDE):
         self.model = None
+        self.max_long_side = max_long_side
         self.easyocr_reader = None
         self._easyocr_initialized = False
+        self._easyocr_lock = threading.Lock()
+        self._ocr_cache = OrderedDict()
+        self._ocr_cache_lock = threading.Lock()
         
         if LatexOCR:
             try:
-                self.model = LatexOCR()
+                self.model = get_latex_model()
             except Exception as e:
                 print(f"Warning: Could not initialize LatexOCR: {e}")
         
-        # Initialize EasyOCR reader (lazy loading)
-        self._init_easyocr()
+        # EasyOCR is loaded lazily on first use (see _init_easyocr)
+    
+    def start_warmup(self):
+        """Load EasyOCR on a background thread so the first request doesn't wait for it"""
+        threading.Thread(target=self._init_easyocr, name="easyocr-warmup", daemon=True).start()
     
     def _init_easyocr(self):
-        """Initialize EasyOCR reader (only once)"""
+        """Initialize EasyOCR reader (only once, including failed attempts)"""
         if self._easyocr_initialized:
             return
         
-        try:
-            import easyocr
-            print("Initializing EasyOCR for handwriting recognition...")
-            # Initialize with English, no GPU, quiet mode
-            self.easyocr_reader = easyocr.Reader(['en'], gpu=False, verbose=False)
+        # Concurrent first requests wait here rather than racing past a half-initialized reader
+        with self._easyocr_lock:
+            if self._easyocr_initialized:
+                return
+            
+            try:
+                self.easyocr_reader = get_easyocr_reader()
+            except ImportError:
+                print("Warning: EasyOCR not installed. Install with: pip install easyocr")
+                self.easyocr_reader = None
+            except Exception as e:
+                print(f"Warning: Could not initialize EasyOCR: {e}")
+                self.easyocr_reader = None
             self._easyocr_initialized = True
-            print("EasyOCR initialized successfully")
-        except ImportError:
-            print("Warning: EasyOCR not installed. Install with: pip install easyocr")
-            self.easyocr_reader = None
-        except Exception as e:
-            print(f"Warning: Could not initialize EasyOCR: {e}")
-            self.easyocr_reader = None
     
-    def extract_equations(self, image: Image.Image) -> List[str]:
+    def _cached_ocr(self, kind: str, image, compute: Callable):
+        """
+        Return a memoized OCR result for identical image content
+        
+        Args:
+            kind: Which engine produced the result, so engines don't share entries
+            image: PIL Image or numpy array that is fed to the engine
+            compute: Zero-argument callable running the engine on a cache miss
+        """
+        pixels = np.asarray(image)
+        key = (kind, pixels.shape, hashlib.blake2b(pixels.tobytes(), digest_size=16).digest())
+        
+        with self._ocr_cache_lock:
+            if key in self._ocr_cache:
+                self._ocr_cache.move_to_end(key)
+                return self._ocr_cache[key]
+        
+        result = compute()
+        with self._ocr_cache_lock:
+            self._ocr_cache[key] = result
+            if len(self._ocr_cache) > OCR_CACHE_SIZE:
+                self._ocr_cache.popitem(last=False)
+        return result
+    
+    def extract_equations(self, image: Image.Image, processed: Optional[np.ndarray] = None) -> List[str]:
         """
         Extract LaTeX equations from an image
         
         Args:
             image: PIL Image object
+            processed: Already-preprocessed pixels of image, if the caller has them
             
         Returns:
             List of LaTeX equation strings
@@ -70,10 +317,17 @@ class LatexOCRService:
         
         try:
             # Preprocess image for better OCR
-            processed_image = self._preprocess_image(image)
+            if processed is None:
+                gray = self._to_grayscale(image)
+                if is_low_contrast(gray):
+                    return []
+                processed = self._binarize(gray)
+            if is_blank(processed):
+                return []
+            processed_image = Image.fromarray(processed)
             
             # Extract LaTeX
-            latex_code = self.model(processed_image)
+            latex_code = self._cached_ocr("latex", processed, lambda: self.model(processed_image))
             
             return [latex_code] if latex_code else []
         
@@ -81,48 +335,60 @@ class LatexOCRService:
             print(f"Error extracting LaTeX: {e}")
             return []
     
-    def _preprocess_image(self, image: Image.Image, for_handwriting=False) -> Image.Image:
+    def _to_grayscale(self, image: Image.Image) -> np.ndarray:
+        """Downscale an image and convert it to a writable grayscale uint8 array"""
+        # Bound resolution so every pixel operation below works on fewer pixels
+        image = downscale_image(image, self.max_long_side)
+        
+        if not HAS_OPENCV:
+            return np.asarray(image.convert('L'))
+        
+        # Already grayscale: one writable copy (Otsu thresholds in place)
+        if image.mode == 'L':
+            return np.array(image)
+        
+        # View the pixels as a numpy array for OpenCV; cvtColor only reads
+        # its input, so no writable copy is needed. RGBA drops alpha in
+        # cvtColor itself rather than via an intermediate RGB image.
+        if image.mode == 'RGBA':
+            return cv2.cvtColor(np.asarray(image), cv2.COLOR_RGBA2GRAY)
+        
+        # Convert to RGB if needed
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        
+        return cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2GRAY)
+    
+    def _binarize(self, gray: np.ndarray, for_handwriting=False) -> np.ndarray:
         """
-        Preprocess image to improve OCR accuracy
+        Threshold a grayscale array for OCR
+        
+        The equation (Otsu) path overwrites gray in place, so callers that need
+        both variants must binarize for handwriting first.
         
         Args:
-            image: PIL Image to preprocess
+            gray: Grayscale array from _to_grayscale
             for_handwriting: If True, apply handwriting-optimized preprocessing
         """
-        # Convert to RGB if needed
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        if not HAS_OPENCV:
+            # Numpy-only Otsu binarization so OCR input stays consistent without OpenCV
+            return otsu_threshold(gray)
         
-        if HAS_OPENCV:
-            # Convert to numpy array for OpenCV processing
-            img_array = np.array(image)
+        if for_handwriting:
+            # Better preprocessing for handwriting
+            # Apply Gaussian blur to reduce noise
+            blurred = cv2.GaussianBlur(gray, (5, 5), 0)
             
-            if for_handwriting:
-                # Better preprocessing for handwriting
-                # Convert to grayscale
-                gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-                
-                # Apply Gaussian blur to reduce noise
-                blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-                
-                # Apply adaptive thresholding (better for variable lighting)
-                thresh = cv2.adaptiveThreshold(
-                    blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                    cv2.THRESH_BINARY, 11, 2
-                )
-                
-                # Convert back to PIL Image
-                processed = Image.fromarray(thresh)
-                return processed
-            else:
-                # Standard preprocessing for equations
-                gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-                _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-                processed = Image.fromarray(thresh)
-                return processed
-        else:
-            # Basic preprocessing without OpenCV
-            return image
+            # Apply adaptive thresholding (better for variable lighting), in place
+            return cv2.adaptiveThreshold(
+                blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
+                cv2.THRESH_BINARY, 11, 2, dst=blurred
+            )
+        
+        # Standard preprocessing for equations; threshold in place over the
+        # grayscale buffer rather than allocating another HxW image
+        _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=gray)
+        return thresh
     
     def extract_text_regions(self, image: Image.Image) -> List[dict]:
         """
@@ -141,26 +407,40 @@ class LatexOCRService:
             return []
         
         try:
-            # Split image into regions (top, middle, bottom) to find final answers
-            width, height = image.size
+            # Downscale once up front; _to_grayscale then leaves the size alone
+            image = downscale_image(image, self.max_long_side)
+            
+            # Binarize the full image once; the bottom region is a slice of it, so
+            # both ink counts come from the same threshold
+            gray = self._to_grayscale(image)
+            if is_low_contrast(gray):
+                return []
+            full_processed = self._binarize(gray)
             
             # Bottom region (where final answers often are)
-            bottom_region = image.crop((0, int(height * 0.7), width, height))
+            bottom_processed = full_processed[int(full_processed.shape[0] * 0.7):]
             bottom_equations = []
             try:
-                processed = self._preprocess_image(bottom_region)
-                latex = self.model(processed)
+                bottom_image = Image.fromarray(bottom_processed)
+                latex = self._cached_ocr("latex", bottom_processed, lambda: self.model(bottom_image))
                 if latex:
                     bottom_equations.append(latex)
             except:
                 pass
             
-            # Full image
-            full_equations = self.extract_equations(image)
+            # When the bottom region holds most of the writing it is the answer;
+            # skip the second, full-image pix2tex pass
+            if bottom_equations:
+                full_ink = count_ink_pixels(full_processed)
+                if full_ink and count_ink_pixels(bottom_processed) / full_ink > BOTTOM_REGION_INK_RATIO:
+                    return bottom_equations
+            
+            # Full image, reusing the preprocessing done for the ink count
+            full_equations = self.extract_equations(image, processed=full_processed)
             
             # Combine, prioritizing bottom region (final answers)
             all_equations = bottom_equations + full_equations
-            return list(dict.fromkeys(all_equations))  # Remove duplicates
+            return dedupe_equations(all_equations)
             
         except Exception as e:
             print(f"Error extracting equations from regions: {e}")
@@ -169,39 +449,80 @@ class LatexOCRService:
     def extract_all_content(self, image: Image.Image) -> dict:
         """
         Extract both equations and text from an image
-        Returns a dictionary with equations and text
+        Returns a dictionary with equations and text, plus which engine read
+        the text, that engine's confidence weighted by text length (0.0 when
+        no text was read) and per-engine wall times in seconds
         """
         result = {
             "equations": [],
             "text": "",
-            "full_content": ""
+            "full_content": "",
+            "confidence": 0.0,
+            "text_engine": "",
+            "method_timings": {}
         }
         
-        # Extract equations
-        equations = self.extract_equations(image)
-        result["equations"] = equations
+        # Bound resolution first so every later stage works on fewer pixels
+        image = downscale_image(image, self.max_long_side)
+        
+        # Load EasyOCR on first use; usually already warmed in the background
+        self._init_easyocr()
+        
+        # Convert to grayscale once and derive both engines' inputs from it;
+        # the handwriting threshold must run before Otsu overwrites gray
+        gray = self._to_grayscale(image)
+        
+        # Nothing is written on a blank page; skip every OCR engine
+        if is_low_contrast(gray):
+            return result
+        
+        handwriting = self._binarize(gray, for_handwriting=True) if self.easyocr_reader else None
+        processed = self._binarize(gray)
+        
+        # Thresholding found (almost) no ink after all
+        if is_blank(processed):
+            return result
+        
+        # Extract equations from the same preprocessed pixels; pix2tex is
+        # independent of the text engines, so decode on a worker thread meanwhile
+        def timed_equations():
+            start = time.perf_counter()
+            equations = self.extract_equations(image, processed)
+            result["method_timings"]["pix2tex"] = time.perf_counter() - start
+            return equations
+        
+        equations_future = _EQUATION_EXECUTOR.submit(timed_equations)
         
         # Try to extract text using EasyOCR (better for handwriting)
         text_parts = []
         
         if self.easyocr_reader:
             try:
-                # Preprocess image for better handwriting recognition
-                processed_img = self._preprocess_image(image, for_handwriting=True)
-                
-                # Convert to numpy array
-                img_array = np.array(processed_img.convert('RGB'))
+                # Handwriting-preprocessed pixels; EasyOCR accepts the
+                # single-channel threshold array as-is
+                img_array = handwriting
                 
                 # Extract text with EasyOCR
-                text_results = self.easyocr_reader.readtext(img_array)
+                start = time.perf_counter()
+                text_results = self._cached_ocr(
+                    "easyocr", img_array, lambda: self.easyocr_reader.readtext(img_array)
+                )
+                result["method_timings"]["easyocr"] = time.perf_counter() - start
                 
-                # Combine all text with confidence threshold
-                for (bbox, text, confidence) in text_results:
-                    if confidence > 0.2:  # Lower threshold for handwriting (was 0.3)
-                        text_parts.append(text.strip())
+                # Combine all text with confidence threshold, filtered in one numpy pass
+                if text_results:
+                    _, texts, confidences = zip(*text_results)
+                    confidences = np.asarray(confidences, dtype=np.float32)
+                    keep = confidences > 0.2  # Lower threshold for handwriting (was 0.3)
+                    text_parts = [text.strip() for text, kept in zip(texts, keep) if kept]
+                    if text_parts:
+                        # Weight by text length so short noisy boxes don't dominate
+                        lengths = np.fromiter((max(len(text), 1) for text in text_parts), dtype=np.float32)
+                        result["confidence"] = float(np.average(confidences[keep], weights=lengths))
                 
                 if text_parts:
                     result["text"] = " ".join(text_parts)
+                    result["text_engine"] = "easyocr"
                     print(f"EasyOCR extracted {len(text_parts)} text regions")
             except Exception as e:
                 print(f"EasyOCR extraction error: {e}")
@@ -209,16 +530,25 @@ class LatexOCRService:
                 traceback.print_exc()
                 # Continue to fallback
         
-        # Fallback to pytesseract if EasyOCR didn't work
-        if not text_parts:
+        # Fallback to pytesseract if EasyOCR found nothing or is unsure of what
+        # it read; keep whichever engine is more confident
+        if result["confidence"] < MIN_TEXT_CONFIDENCE:
             try:
-                import pytesseract
-                result["text"] = pytesseract.image_to_string(image)
+                start = time.perf_counter()
+                tesseract_text, tesseract_confidence = read_tesseract(image)
+                result["method_timings"]["tesseract"] = time.perf_counter() - start
+                if tesseract_text and (tesseract_confidence > result["confidence"] or not text_parts):
+                    result["text"] = tesseract_text
+                    result["confidence"] = tesseract_confidence
+                    result["text_engine"] = "tesseract"
             except ImportError:
                 pass  # pytesseract not available
             except Exception as e:
                 print(f"Tesseract error: {e}")
         
+        equations = equations_future.result()
+        result["equations"] = equations
+        
         # Combine all content
         all_parts = []
         if result["text"]:
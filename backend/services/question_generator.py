@@ -1,35 +1,18 @@
 """
 Service for generating practice questions based on mistakes
 """
-import os
+import uuid
 from typing import List, Dict
-import json
-from dotenv import load_dotenv
+import orjson
 
-# Load environment variables
-load_dotenv()
-
-# Use Groq API
-try:
-    from groq import Groq
-    api_key = os.getenv("GROQ_API_KEY")
-    if api_key:
-        client = Groq(api_key=api_key)
-        USE_GROQ = True
-    else:
-        USE_GROQ = False
-        client = None
-except Exception as e:
-    print(f"Warning: Could not initialize Groq client: {e}")
-    USE_GROQ = False
-    client = None
+# Completions go through the async Groq client shared with the analyzer
+from services.ai_analyzer import USE_GROQ, async_completion_text
 
 
 class QuestionGenerator:
     """Service for generating practice questions"""
     
     def __init__(self):
-        self.client = client
         self.use_groq = USE_GROQ
     
     async def generate_questions(
@@ -53,7 +36,7 @@ class QuestionGenerator:
         Returns:
             List of practice question dictionaries
         """
-        if not self.client:
+        if not self.use_groq:
             return []
         
         mistakes = mistakes or []
@@ -113,7 +96,8 @@ Return as JSON object with a "questions" array:
 """
         
         if self.use_groq:
-            response = self.client.chat.completions.create(
+            # Awaiting the async client yields the event loop to other requests
+            result = await async_completion_text(
                 model="llama-3.3-70b-versatile",
                 messages=[
                     {"role": "system", "content": "You are an expert math and physics tutor creating practice questions. Always return valid JSON arrays."},
@@ -122,20 +106,10 @@ Return as JSON object with a "questions" array:
                 temperature=0.7,
                 response_format={"type": "json_object"}
             )
-            result = response.choices[0].message.content
-            # Groq returns JSON object, extract the array if needed
-            try:
-                parsed = json.loads(result)
-                if "questions" in parsed:
-                    result = json.dumps(parsed["questions"])
-                elif isinstance(parsed, list):
-                    result = json.dumps(parsed)
-            except:
-                pass
         
         try:
-            parsed = json.loads(result)
-            # Handle different response formats
+            parsed = orjson.loads(result)
+            # Handle different response formats (Groq returns a JSON object with a "questions" array)
             if isinstance(parsed, list):
                 questions = parsed
             elif isinstance(parsed, dict) and "questions" in parsed:
@@ -149,7 +123,6 @@ Return as JSON object with a "questions" array:
             # Ensure all questions have required fields
             for q in questions:
                 if "id" not in q:
-                    import uuid
                     q["id"] = str(uuid.uuid4())
                 if "solution_steps" not in q:
                     q["solution_steps"] = []
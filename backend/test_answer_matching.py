@@ -0,0 +1,55 @@
+"""
+Offline tests for answer normalization and the answer-key shortcut that
+decides which answers still need the LLM
+
+No server or Groq key is needed: pytest test_answer_matching.py
+"""
+from services.ai_analyzer import normalize_answer, select_answers_for_review
+
+
+def test_normalize_folds_spacing_case_and_ocr_confusions():
+    assert normalize_answer("X = 1O") == normalize_answer("x=10")
+    assert normalize_answer("S") == "5"
+    assert normalize_answer(42) == "42"
+
+
+def test_all_answers_match_key():
+    answers, correct = select_answers_for_review(
+        {"1": "42", "2": "x = 3"},
+        {"1": "42", "2": "x=3"}
+    )
+    assert answers == {}
+    assert correct == {}
+
+
+def test_partial_mismatch_keeps_only_wrong_answers():
+    answers, correct = select_answers_for_review(
+        {"1": "42", "2": "7"},
+        {"1": "42", "2": "5"}
+    )
+    assert answers == {"2": "7"}
+    assert correct == {"2": "5"}
+
+
+def test_blank_keyed_question_is_a_mismatch():
+    answers, correct = select_answers_for_review({"1": "2"}, {"1": "2", "2": "5"})
+    assert answers == {"2": ""}
+    assert correct == {"2": "5"}
+
+
+def test_unkeyed_extra_answer_is_kept():
+    answers, correct = select_answers_for_review({"1": "2", "3": "9"}, {"1": "2"})
+    assert answers == {"3": "9"}
+    assert correct == {}
+
+
+def test_int_and_str_keys_match():
+    answers, _ = select_answers_for_review({1: "2", "2": "5"}, {"1": "2", 2: "5"})
+    assert answers == {}
+
+
+def test_without_key_every_answer_is_reviewed():
+    user_answers = {"1": "2", "2": "5"}
+    answers, correct = select_answers_for_review(user_answers, None)
+    assert answers == user_answers
+    assert correct is None
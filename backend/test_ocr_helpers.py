@@ -0,0 +1,45 @@
+"""
+Offline tests for the numpy-only OCR helpers in services.latex_ocr
+
+No OCR engine or server is needed: pytest test_ocr_helpers.py
+"""
+import numpy as np
+
+from services.latex_ocr import dedupe_equations, is_blank, is_low_contrast, otsu_threshold
+
+
+def make_page(ink=False, seed=0):
+    """Light paper with grain, optionally with a dark stroke written on it"""
+    rng = np.random.default_rng(seed)
+    page = rng.normal(200, 4, size=(200, 300)).clip(0, 255).astype(np.uint8)
+    if ink:
+        page[90:100, 50:250] = 30
+    return page
+
+
+def test_otsu_separates_two_levels():
+    gray = np.full((10, 10), 220, dtype=np.uint8)
+    gray[:, :3] = 20
+    binary = otsu_threshold(gray)
+    assert set(np.unique(binary)) == {0, 255}
+    assert (binary[:, :3] == 0).all()
+    assert (binary[:, 3:] == 255).all()
+
+
+def test_grainy_blank_page_is_low_contrast():
+    assert is_low_contrast(make_page())
+
+
+def test_written_page_has_contrast():
+    page = make_page(ink=True)
+    assert not is_low_contrast(page)
+    assert not is_blank(otsu_threshold(page))
+
+
+def test_uniform_binary_page_is_blank():
+    assert is_blank(np.full((50, 50), 255, dtype=np.uint8))
+
+
+def test_dedupe_ignores_whitespace_and_keeps_order():
+    equations = ["x = 2", "y=3", "x=2", "x  =  2"]
+    assert dedupe_equations(equations) == ["x = 2", "y=3"]